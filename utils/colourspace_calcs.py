@@ -7,56 +7,93 @@
 # This short utility generates colour space matrices and offsets for
 # inclusion in the backend_default_config.json file.
 
+import json
+import re
+import sys
+
 import numpy as np
 
-BT601 = np.array([[0.299, 0.5870, 0.1140], [-0.168736, -0.331264, 0.5], [0.5, -0.418688, -0.081312]])
-REC709 = np.array([[0.2126, 0.7152, 0.0722], [-0.1146, -0.3854, 0.5], [0.5, -0.4542, -0.0458]])
-REC2020 = np.array([[0.2627, 0.6780, 0.0593], [-0.13963006, -0.36036994, 0.5], [0.5, -0.4597857, -0.0402143]])
+# Keep these in float64: the inverse offsets reach ~2^26 once scaled to fixed-point,
+# beyond the 24 bit significand of float32.
+BT601 = np.array([[0.299, 0.5870, 0.1140], [-0.168736, -0.331264, 0.5], [0.5, -0.418688, -0.081312]],
+                 dtype=np.float64)
+REC709 = np.array([[0.2126, 0.7152, 0.0722], [-0.1146, -0.3854, 0.5], [0.5, -0.4542, -0.0458]],
+                  dtype=np.float64)
+REC2020 = np.array([[0.2627, 0.6780, 0.0593], [-0.13963006, -0.36036994, 0.5], [0.5, -0.4597857, -0.0402143]],
+                   dtype=np.float64)
 
-colour_spaces = {"select": "default"}
 
 def flatten(array):
-    return [round(num) for num in list(array.flatten())]
-
-def add_entry(name, M, limited):
-    offsets = np.array([0, 128, 128])
-    scaling = np.array([[(235 - 16) / 255, 0, 0], [0, (240 - 16) / 255, 0], [0, 0, (240 - 16) / 255]])
-    if limited:
-        offsets = np.array([16, 128, 128])
-        M = np.matmul(scaling, M)
-    Mi = np.linalg.inv(M)
-    colour_spaces[name] = {}
-    colour_spaces[name]["ycbcr"] = {}
-    colour_spaces[name]["ycbcr"]["coeffs"] = flatten(M * 1024)
-    colour_spaces[name]["ycbcr"]["offsets"] = flatten(offsets * (2 ** 18))
-    colour_spaces[name]["ycbcr_inverse"] = {}
-    colour_spaces[name]["ycbcr_inverse"]["coeffs"] = flatten(Mi * 1024)
-    inv_offsets = np.rint(np.dot(Mi, -offsets) * (2 ** 18))
-    colour_spaces[name]["ycbcr_inverse"]["offsets"] = flatten(inv_offsets)
-    if inv_offsets.min() < -2 ** 26 or inv_offsets.max() >= 2 ** 26:
-        print("WARNING:", name, "will overflow!")
-
-add_entry("default", BT601, limited=False)
-add_entry("jpeg", BT601, limited=False)
-add_entry("smpte170m", BT601, limited=True)
-add_entry("rec709", REC709, limited=True)
-add_entry("rec709_full", REC709, limited=False)
-add_entry("bt2020", REC2020, limited=True)
-add_entry("bt2020_full", REC2020, limited=False)
-
-def print_dict(d, indent=0):
-    print("{")
-    indent += 4
-    for i, (k, v) in enumerate(d.items()):
-        if type(v) is dict:
-            print(" " * indent, f'"{k}"', ": ", end='', sep='')
-            print_dict(v, indent)
-        else:
-            print(" " * indent, f'"{k}"', ": ", v, end='', sep='')
-        print("," if i < len(d) - 1 else "")
-    indent -= 4
-    print(" " * indent, "}", end ='', sep='')
-
-final_dict = {"colour_encoding": colour_spaces}
-print_dict(final_dict)
-print()
+    return np.rint(array).astype(np.int32).ravel()
+
+
+# Diagonal of the limited range scaling matrix.
+LIMITED_SCALING = np.array([(235 - 16) / 255, (240 - 16) / 255, (240 - 16) / 255], dtype=np.float64)
+
+for constant in (BT601, REC709, REC2020, LIMITED_SCALING):
+    constant.setflags(write=False)
+
+
+def add_entries(colour_spaces, entries):
+    names, matrices, is_limited = zip(*entries)
+    # Stack all the matrices, so every entry is computed in a single batch.
+    M = np.stack(matrices)
+    limited = np.array(is_limited)[:, np.newaxis]
+    offsets = np.where(limited, [16, 128, 128], [0, 128, 128])
+    scaling = np.where(limited, LIMITED_SCALING, 1.0)
+    # Several entries share the same matrix, so only invert each distinct one once.
+    unique, index = np.unique(M, axis=0, return_inverse=True)
+    # The scaling is diagonal, so scale the rows of M and the columns of its inverse.
+    Mi = np.linalg.inv(unique)[index.reshape(-1)] / scaling[:, np.newaxis, :]
+    M = scaling[:, :, np.newaxis] * M
+    # Solve for the inverse offsets directly rather than going through the inverse matrix.
+    inv_offsets = np.rint(np.linalg.solve(M, -offsets[:, :, np.newaxis])[:, :, 0] * (2 ** 18))
+    overflow = ((inv_offsets < -2 ** 26) | (inv_offsets >= 2 ** 26)).any(axis=1)
+
+    for i, name in enumerate(names):
+        colour_spaces[name] = {}
+        colour_spaces[name]["ycbcr"] = {}
+        colour_spaces[name]["ycbcr"]["coeffs"] = flatten(M[i] * 1024)
+        colour_spaces[name]["ycbcr"]["offsets"] = flatten(offsets[i] * (2 ** 18))
+        colour_spaces[name]["ycbcr_inverse"] = {}
+        colour_spaces[name]["ycbcr_inverse"]["coeffs"] = flatten(Mi[i] * 1024)
+        colour_spaces[name]["ycbcr_inverse"]["offsets"] = flatten(inv_offsets[i])
+        if overflow[i]:
+            print("WARNING:", name, "will overflow!")
+
+
+# Matches a list of integers, so it can be collapsed onto a single line.
+int_list = re.compile(r'\[\s*([-\d,\s]+?)\]')
+
+
+# Serialises the int arrays directly, so they need not be converted to lists first.
+class NumpyEncoder(json.JSONEncoder):
+    def default(self, o):
+        if isinstance(o, np.ndarray):
+            return o.tolist()
+        return super().default(o)
+
+
+def to_json(d):
+    return int_list.sub(lambda m: '[' + ' '.join(m.group(1).split()) + ']',
+                        json.dumps(d, indent=4, cls=NumpyEncoder))
+
+
+def main():
+    colour_spaces = {"select": "default"}
+    add_entries(colour_spaces, [
+        ("default", BT601, False),
+        ("jpeg", BT601, False),
+        ("smpte170m", BT601, True),
+        ("rec709", REC709, True),
+        ("rec709_full", REC709, False),
+        ("bt2020", REC2020, True),
+        ("bt2020_full", REC2020, False),
+    ])
+
+    final_dict = {"colour_encoding": colour_spaces}
+    sys.stdout.write(to_json(final_dict) + '\n')
+
+
+if __name__ == '__main__':
+    main()
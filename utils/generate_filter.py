@@ -8,14 +8,20 @@
 
 import numpy as np
 import argparse
+import sys
+
+
+class InvalidFilterError(Exception):
+    pass
 
 
 # Lanczos (order, length)
 # Order is typically 2 or 3
 def lanczos(order, N):
-    x = np.linspace(-order, +order, N + 6, dtype=np.float64)
-    h = np.where((x > -order) & (x < order), np.sinc(x) * np.sinc(x / order), 0)
-    return h[3:-3]
+    # Only the centre N samples are kept, and these all lie strictly inside
+    # the window, so just evaluate the kernel there.
+    x = np.linspace(-order, +order, N + 6, dtype=np.float64)[3:-3]
+    return np.sinc(x) * np.sinc(x / order)
 
 
 # Mitchell - Netravali filters (B, C, length)
@@ -23,50 +29,30 @@ def lanczos(order, N):
 # B,C = (1/3,1/3) is a good compromise
 # B,C = (0, 0.5) for Catmull-Rom
 def mitchell(B, C, N):
-    x = np.linspace(-2, +2, N, dtype=np.float64)
-    h = np.zeros(N)
-    for i in range(N):
-        ax = abs(x[i])
-        if ax < 1:
-            h[i] = ((12 - 9 * B - 6 * C) * ax**3 + (-18 + 12 * B + 6 * C) * ax**2 + (6 - 2 * B)) / 6
-        elif (ax >= 1) and (ax < 2):
-            h[i] = ((-B - 6 * C) * ax**3 + (6 * B + 30 * C) * ax**2 + (-12 * B - 48 * C) * ax + (8 * B + 24 * C)) / 6
-    return h
+    ax = np.abs(np.linspace(-2, +2, N, dtype=np.float64))
+    # Evaluate both cubics in Horner form.
+    h1 = (((12 - 9 * B - 6 * C) * ax + (-18 + 12 * B + 6 * C)) * ax * ax + (6 - 2 * B)) / 6
+    h2 = ((((-B - 6 * C) * ax + (6 * B + 30 * C)) * ax + (-12 * B - 48 * C)) * ax + (8 * B + 24 * C)) / 6
+    return np.where(ax < 1, h1, np.where(ax < 2, h2, 0.0))
 
 
 # bicubic_spline(alpha, length);
 # alpha is typically set to -0.5 (Hermite spline) or -0.75
 def bicubic_spline(a, N):
-    x = np.linspace(-2, +2, N, dtype=np.float64)
-    h = np.zeros(N)
-    for i in range(N):
-        ax = abs(x[i])
-        if ax <= 1:
-            h[i] = (a + 2) * ax**3 - (a + 3) * ax**2 + 1
-        elif (ax > 1) and (ax < 2):
-            h[i] = (a) * ax**3 - (5 * a) * ax**2 + (8 * a) * ax - (4 * a)
-    return h
-
-
-def main():
-    parser = argparse.ArgumentParser(formatter_class=argparse.RawTextHelpFormatter)
-    parser.add_argument('--phases', metavar='P', type=int, help='Number of phases.', default=16)
-    parser.add_argument('--taps', metavar='T', type=int, help='Number of filter taps per phase.', default=6)
-    parser.add_argument('--precision', metavar='PR', type=int, help='Filter precision required.', default=10)
-    parser.add_argument('--filter', type=str, metavar='F',
-                        help='Filter type and parameters, e.g.: \n'
-                        '"Mitchell, b = 0.333, c = 0.333"\n'
-                        '"Lanczos, order = 3"\n'
-                        '"bicubic_spline, a=-0.5"', required=True)
-
-    args = parser.parse_args()
-
-    phases = args.phases
-    taps = args.taps
-    precision = args.precision
-
+    ax = np.abs(np.linspace(-2, +2, N, dtype=np.float64))
+    # Evaluate both cubics in Horner form.
+    h1 = ((a + 2) * ax - (a + 3)) * ax * ax + 1
+    h2 = ((a * ax - 5 * a) * ax + 8 * a) * ax - 4 * a
+    return np.where(ax <= 1, h1, np.where(ax < 2, h2, 0.0))
+
+
+# Generate the per-phase fixed-point filter coefficients for a filter string,
+# e.g. "Mitchell, b = 0.333, c = 0.333". Returns the filter name and a
+# (phases, taps) array of coefficients. This does no argument parsing or output,
+# so parameter sweeps can call it directly without a new process per filter.
+def generate_filter(filter_str, phases, taps, precision):
     # Parse the filter string and pick out the needed parameters.
-    filt = args.filter.split(',')
+    filt = filter_str.split(',')
     params = {'a': 0., 'b': 0., 'c': 0., 'order': 0}
     for param in filt[1:]:
         p = param.replace(' ', '').split('=')
@@ -74,36 +60,59 @@ def main():
 
     # Generate the filter.
     if (filt[0].lower() == 'mitchell'):
-        filter = f'"Michell - Netravali (B = {params["b"]:.3f}, C = {params["c"]:.3f})": [\n'
+        name = f'Michell - Netravali (B = {params["b"]:.3f}, C = {params["c"]:.3f})'
         h = mitchell(params['b'], params['c'], phases * taps)
     elif (filt[0].lower() == 'lanczos'):
-        filter = f'"Lanczos order {params["order"]}": [\n'
+        name = f'Lanczos order {params["order"]}'
         h = lanczos(params['order'], phases * taps)
     elif (filt[0].lower() == 'bicubic_spline'):
-        filter = f'"Bicubic-spline (a = {params["a"]:.3f})": [\n'
+        name = f'Bicubic-spline (a = {params["a"]:.3f})'
         h = bicubic_spline(params['a'], phases * taps)
     else:
-        print(f'Invalid filter ({filt[0]}) selected!')
-        exit()
+        raise InvalidFilterError(f'Invalid filter ({filt[0]}) selected!')
 
     # Normalise and convert to fixed-point.
     h = h * phases / np.sum(h)
     h = np.rint(h * (1 << precision)).astype(np.int32)
 
-    ppf = np.zeros((phases, taps), dtype=np.int32)
-    for i in range(phases):
-        # Pick out phases and flip array.
-        ppf[i] = (h[i::phases])[::-1]
-        # Make sure there is no DC change by adjusting the largest coefficients.
-        max_index = np.nonzero(ppf[i] == ppf[i].max())[0]
-        ppf[i, max_index] += (1 << precision) - np.int32(ppf[i].sum() / max_index.size)
+    # Pick out phases and flip array.
+    ppf = h.reshape(taps, phases).T[:, ::-1].copy()
+    # Make sure there is no DC change by adjusting the largest coefficients.
+    max_mask = ppf == ppf.max(axis=1, keepdims=True)
+    count = max_mask.sum(axis=1, keepdims=True)
+    ppf += max_mask * ((1 << precision) - np.trunc(ppf.sum(axis=1, keepdims=True) / count).astype(np.int32))
+
+    return name, ppf
+
+
+def main():
+    parser = argparse.ArgumentParser(formatter_class=argparse.RawTextHelpFormatter)
+    parser.add_argument('--phases', metavar='P', type=int, help='Number of phases.', default=16)
+    parser.add_argument('--taps', metavar='T', type=int, help='Number of filter taps per phase.', default=6)
+    parser.add_argument('--precision', metavar='PR', type=int, help='Filter precision required.', default=10)
+    parser.add_argument('--filter', type=str, metavar='F',
+                        help='Filter type and parameters, e.g.: \n'
+                        '"Mitchell, b = 0.333, c = 0.333"\n'
+                        '"Lanczos, order = 3"\n'
+                        '"bicubic_spline, a=-0.5"', required=True)
+
+    args = parser.parse_args()
+
+    phases = args.phases
+
+    try:
+        name, ppf = generate_filter(args.filter, phases, args.taps, args.precision)
+    except InvalidFilterError as e:
+        print(e, file=sys.stderr)
+        sys.exit(1)
 
-    nl = '\n'
+    lines = [f'"{name}": [']
     for i in range(phases):
         phase = ', '.join([f'{c:>4}' for c in ppf[i, :]])
-        filter += f'    {phase}{nl+"]" if i==phases-1 else ","+nl}'
+        lines.append(f'    {phase}{"" if i==phases-1 else ","}')
+    lines.append(']')
 
-    print(filter)
+    print('\n'.join(lines))
 
 
 if __name__ == '__main__':
@@ -5,40 +5,88 @@
 #
 # Generate version information for libcamera-apps
 
+import re
 import subprocess
 import sys
 from datetime import datetime
-from string import hexdigits
+from pathlib import Path
 
 digits = 12
 
 
+# Return the HEAD commit id by reading the git directory directly, which saves
+# spawning git. Returns None if this cannot be done (e.g. no .git directory, a
+# worktree, an unborn branch or a nested symbolic ref), in which case git itself should be asked.
+def read_git_head():
+    cwd = Path.cwd()
+    for path in (cwd, *cwd.parents):
+        git_dir = path / '.git'
+        if git_dir.exists():
+            break
+    else:
+        return None
+
+    if not git_dir.is_dir():
+        return None
+
+    commit = None
+    try:
+        head = (git_dir / 'HEAD').read_text().strip()
+        if not head.startswith('ref: '):
+            commit = head
+        elif (git_dir / head[5:]).is_file():
+            commit = (git_dir / head[5:]).read_text().strip()
+        elif (git_dir / 'packed-refs').is_file():
+            for line in (git_dir / 'packed-refs').read_text().splitlines():
+                sha, _, name = line.partition(' ')
+                if name == head[5:]:
+                    commit = sha
+                    break
+    except OSError:
+        pass
+
+    # Anything other than a plain commit id (e.g. a ref pointing at another
+    # symbolic ref) is left for git to resolve.
+    if commit is None or not re.fullmatch('[0-9a-f]{40}|[0-9a-f]{64}', commit):
+        return None
+
+    return commit
+
+
 def generate_version():
     try:
         if len(sys.argv) == 2:
-            # Check if this is a git directory
-            r = subprocess.run(['git', 'rev-parse', '--git-dir'],
-                                stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, universal_newlines=True)
-            if r.returncode:
-                raise RuntimeError('Invalid git directory!')
+            # Get commit id, reading it directly from the git directory if possible
+            commit = read_git_head()
+            if commit is None:
+                # Check if this is a git directory
+                r = subprocess.run(['git', 'rev-parse', '--git-dir'],
+                                   stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+                if r.returncode:
+                    raise RuntimeError('Invalid git directory!')
 
-            # Get commit id
-            r = subprocess.run(['git', 'rev-parse', '--verify', 'HEAD'],
-                                stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, universal_newlines=True)
-            if r.returncode:
-                raise RuntimeError('Invalid git commit!')
+                r = subprocess.run(['git', 'rev-parse', '--verify', 'HEAD'],
+                                   stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+                if r.returncode:
+                    raise RuntimeError('Invalid git commit!')
 
-            commit = r.stdout.strip('\n')[0:digits]
+                commit = r.stdout.decode('ascii').strip('\n')
+
+            commit = commit[0:digits]
 
             # Check dirty status
             r = subprocess.run(['git', 'diff-index', '--quiet', 'HEAD'],
-                                stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, universal_newlines=True)
-            if r.returncode:
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+            # diff-index exits with 1 for a dirty tree, anything else means git failed
+            # (e.g. it refused a repository owned by another user).
+            if r.returncode == 1:
                 commit = commit + '-dirty'
+            elif r.returncode:
+                raise RuntimeError('Invalid git directory!')
 
         elif len(sys.argv) == 3:
             commit = sys.argv[2].lower().strip()
-            if any(c not in hexdigits for c in commit):
+            if not re.fullmatch('[0-9a-f]*', commit):
                 raise RuntimeError('Invalid git sha!')
 
             commit = commit[0:digits]